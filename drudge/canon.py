@@ -5,7 +5,12 @@ by delegating the actual work to the core canonpy module.
 
 """
 
+import array
+import collections
+import functools
 import itertools
+import math
+import threading
 import typing
 import warnings
 
@@ -24,6 +29,14 @@ IDENT = 0
 NEG = 1
 CONJ = 2
 
+# The sign and the transformation on the factor for each action.
+_ACC_ACTIONS = (
+    (1, lambda x: x),  # IDENT
+    (-1, lambda x: x),  # NEG
+    (1, conjugate),  # CONJ
+    (-1, conjugate)  # NEG | CONJ
+)
+
 
 class Eldag:
     """A shallow container for information about an Eldag.
@@ -33,11 +46,13 @@ class Eldag:
 
     """
 
+    __slots__ = ['edges', 'ia', 'symms', 'colours']
+
     def __init__(self):
         """Initialize the Eldag."""
 
-        self.edges = []
-        self.ia = [0]
+        self.edges = array.array('i')
+        self.ia = array.array('i', [0])
         self.symms = []
         self.colours = []
 
@@ -46,17 +61,39 @@ class Eldag:
 
         The index of the given node will be returned.
         """
-        self.edges.extend(edges)
-        self.ia.append(len(self.edges))
+        all_edges = self.edges
+        all_edges.extend(edges)
+        self.ia.append(len(all_edges))
         self.symms.append(symm)
-        self.colours.append(colour)
 
-        return len(self.symms) - 1
+        colours = self.colours
+        colours.append(colour)
+        return len(colours) - 1
 
     @property
     def int_colour(self):
         """Get the integral form of the current node colours."""
 
+        # Each colour is hashed only once to get a dense label by its first
+        # appearance, then only the distinct colours need to be sorted.
+        labels = {}
+        try:
+            node_labels = [
+                labels.setdefault(i, len(labels)) for i in self.colours
+            ]
+        except TypeError:
+            # Unhashable colours, sorting all the nodes is needed.
+            return self._sort_int_colour()
+
+        ranks = [0] * len(labels)
+        for i, v in enumerate(sorted(labels.items())):
+            ranks[v[1]] = i
+
+        return [ranks[i] for i in node_labels]
+
+    def _sort_int_colour(self):
+        """Get the integral form of the colours by sorting all nodes."""
+
         int_colour = [None for _ in self.colours]
 
         group_res = enumerate(itertools.groupby(
@@ -68,8 +105,6 @@ class Eldag:
             _, g = v
             for _, idx in g:
                 int_colour[idx] = i
-                continue
-            continue
 
         return int_colour
 
@@ -111,104 +146,299 @@ def canon_factors(sums, factors, symms):
     The symmetries should be given as a mapping from the *base* of the factors
     to the actual symmetries.
 
+    The results are cached for terms with the same summations, factors, and
+    symmetries of the factors, since the same terms are frequently
+    canonicalized again and again.
+
     """
 
-    # They need to be looped over multiple times.
-    sums = list(sums)
-    factors = list(factors)
+    term = _prep_term(sums, factors, symms)
+    sums, factors, factors_symms = term
+
+    try:
+        key = (
+            tuple(sums), tuple((i[0], i[3]) for i in factors),
+            tuple(factors_symms)
+        )
+        hash(key)
+    except TypeError:
+        # Unhashable colours or ranges are not cached.
+        return _canon_terms([term])[0][0]
+
+    entry = _get_cached(key)
+    if entry is not None:
+        sums_res, factors_res, coeff, suspicious = entry
+        # The warnings are given for each occurrence, even from the cache.
+        for i in suspicious:
+            _warn_many_dumms(i, 2)
+        return list(sums_res), list(factors_res), coeff
+
+    res, suspicious = _canon_terms([term])
+    sums_res, factors_res, coeff = res[0]
+    _set_cached(key, (
+        tuple(sums_res), tuple(factors_res), coeff, tuple(suspicious[0])
+    ))
+
+    return sums_res, factors_res, coeff
+
+
+def canon_factors_batch(terms):
+    """Canonicalize the factors of multiple terms together.
+
+    The terms should be given as an iterable of triples of the summations,
+    factors, and symmetries, as the arguments to :py:func:`canon_factors`.  A
+    list of the canonicalization results for each of the terms, in the format
+    of the result of :py:func:`canon_factors`, is returned.
+
+    All the terms are put into the same Eldag, with the colours of their nodes
+    prefixed by the index of the term.  In this way, the terms are never mixed
+    with each other, while they can be canonicalized in a single call to the
+    core canonicalization function.
+
+    """
+
+    return _canon_terms([_prep_term(*i) for i in terms])[0]
+
+
+#
+# Internals
+# ---------
+#
+
 
-    # TODO: make handling of empty eldags more elegant.
-    if len(factors) == 0 and len(sums) == 0:
-        return sums, factors, 1
+# Cache of the canonicalization results, in least-recently-used order.  All
+# accesses are guarded by the lock, since canonicalizations can be concurrent.
+_CANON_CACHE_SIZE = 4096
+_canon_cache = collections.OrderedDict()
+_canon_cache_lock = threading.Lock()
+
+
+def _get_cached(key):
+    """Get the cached canonicalization result for the key.
+
+    None is returned when the key is not cached.
+    """
+
+    with _canon_cache_lock:
+        entry = _canon_cache.get(key)
+        if entry is not None:
+            _canon_cache.move_to_end(key)
+    return entry
+
+
+def _set_cached(key, entry):
+    """Cache the canonicalization result for the key."""
+
+    with _canon_cache_lock:
+        _canon_cache[key] = entry
+        if len(_canon_cache) > _CANON_CACHE_SIZE:
+            _canon_cache.popitem(last=False)
+
+
+def _canon_terms(terms):
+    """Canonicalize the prepared terms together.
+
+    The terms should be given as the result from :py:func:`_prep_term`.  The
+    results are returned along with the index expressions with too many summed
+    dummies in each of the terms, which have already been warned about.
+    """
+
+    res = [None for _ in terms]
+    suspicious = [[] for _ in terms]
+
+    eldag = Eldag()
+    sums_starts = {}
+    factor_idxes = {}
+
+    for i, (sums, factors, factors_symms) in enumerate(terms):
+        # Without symmetric factors, nothing can be changed unless there are
+        # summations to be permuted.  This also covers empty terms.
+        if len(sums) < 2 and all(j is None for j in factors_symms):
+            res[i] = (sums, [j[0] for j in factors], 1)
+        else:
+            sums_starts[i] = len(eldag.colours)
+            factor_idxes[i] = _build_eldag(
+                eldag, i, sums, factors, factors_symms, suspicious[i]
+            )
+
+    for i in suspicious:
+        for j in i:
+            _warn_many_dumms(j, 3)
+
+    if len(sums_starts) == 0:
+        return res, suspicious
 
-    eldag, factor_idxes = _build_eldag(sums, factors, symms)
     node_order, perms = eldag.canon()
 
-    # Sums are guaranteed to be in the initial segment of the nodes, but they
-    # might not be at the beginning any more after the canonicalization.
-    sums_res = [sums[i] for i in node_order if
-                eldag.colours[i][0] == _SUM]
+    # Sums are guaranteed to be in the initial segment of the nodes for each
+    # term, but they might not be at the beginning any more after the
+    # canonicalization.
+    sums_res = {i: [] for i in sums_starts}
+    for i in node_order:
+        colour = eldag.colours[i]
+        if colour[1] == _SUM:
+            term_idx = colour[0]
+            sums_res[term_idx].append(
+                terms[term_idx][0][i - sums_starts[term_idx]]
+            )
+
+    for i, v in factor_idxes.items():
+        factors_res, coeff = _get_canon_factors(terms[i][1], v, perms)
+        res[i] = (sums_res[i], factors_res, coeff)
+
+    return res, suspicious
+
+
+def _prep_term(sums, factors, symms):
+    """Prepare a term for canonicalization.
+
+    The summations and factors need to be looped over multiple times.  The
+    base and indices of the factors are also queried only once, with their
+    symmetries looked up.
+
+    """
+
+    sums = list(sums)
+    factors = [(i, i.base, i.indices, j) for i, j in factors]
+    factors_symms = [_get_symms(i[1], len(i[2]), symms) for i in factors]
+    return sums, factors, factors_symms
+
+
+def _get_canon_factors(factors, factor_idxes, perms):
+    """Get the canonicalized factors from the permutations of their nodes.
+
+    The canonicalized factors are returned, along with the coefficient from
+    the anti-commutative quantities.
+    """
 
     coeff = 1
     factors_res = []
 
-    for i, v in enumerate(factors):
+    for (factor, base, indices, _), idx in zip(factors, factor_idxes):
 
-        factor = v[0]
-        indices = factor.indices
         valency = len(indices)
-        perm = perms[factor_idxes[i]]
+        perm = perms[idx]
 
         if valency < 2 or perm is None:
             factor_res = factor
         else:
-            factor_res = factor.base[tuple(
-                indices[perm[i]] for i in range(valency)
-            )]
-            acc = perm.acc
-            if acc & NEG:
-                coeff *= -1
-            if acc & CONJ:
-                # TODO: Make vector has sensible error here.
-                factor_res = conjugate(factor_res)
+            factor_res = base[tuple(indices[i] for i in perm)]
+            # TODO: Make vector has sensible error here for conjugation.
+            sign, action = _ACC_ACTIONS[perm.acc & (NEG | CONJ)]
+            coeff *= sign
+            factor_res = action(factor_res)
 
         factors_res.append(factor_res)
-        continue
 
-    return sums_res, factors_res, coeff
-
-
-#
-# Internals
-# ---------
-#
+    return factors_res, coeff
 
 
-def _build_eldag(sums, factors, symms):
-    """Build the eldag for the factors.
+def _build_eldag(eldag, term_idx, sums, factors, factors_symms, suspicious):
+    """Build the eldag for the factors of a term into the given Eldag.
 
     The summations will be put as the first nodes.  Then each factor is treated
-    one by one, with its indices coming before itself.
+    one by one, with its indices coming before itself.  The factors should be
+    given as tuples of the factor, its base, its indices, and its colour, with
+    their symmetries given separately.  All the colours are prefixed by the
+    index of the term.  The indices of the nodes for the factors are returned,
+    while the index expressions with too many summed dummies are appended to
+    the given suspicious list.
 
     """
 
-    eldag = Eldag()
     factor_idxes = []
-
-    # No need to touch edges for sums.
-    for i in sums:
-        # Use args of ranges for lex comparison.
-        eldag.add_node([], None, (_SUM, i[1].sort_key))
-        continue
+    sums_start = len(eldag.colours)
+
+    # No need to touch edges for sums.  The colour is built only once for each
+    # range, since summations over the same range are very common.
+    sum_colours = {}
+    for _, range_ in sums:
+        if range_ in sum_colours:
+            colour = sum_colours[range_]
+        else:
+            # Use args of ranges for lex comparison, in hashable form.
+            colour = (term_idx, _SUM, tuple(range_.sort_key))
+            sum_colours[range_] = colour
+        eldag.add_node([], None, colour)
 
     # Real work, factors.
     #
     # From symbol to node.
-    dumms = {v[0]: i for i, v in enumerate(sums)}
-
-    for factor, colour in factors:
-        base = factor.base
-        indices = factor.indices
-        n_indices = len(indices)
-
-        if n_indices < 2:
-            factor_symms = None
-        elif (base, n_indices) in symms:
-            factor_symms = symms[base, n_indices]
-        elif base in symms:
-            factor_symms = symms[base]
-        else:
-            factor_symms = None
+    dumms = {v[0]: i + sums_start for i, v in enumerate(sums)}
+
+    colours = eldag.colours
+
+    # Reused for all the factors, since the edges are copied into the Eldag.
+    index_nodes = []
+
+    for (_, _, indices, colour), factor_symms in zip(factors, factors_symms):
+        index_nodes.clear()
+
+        # The symmetry of the expressions at the indices with respect to the
+        # dummies are fully treated.
+        for expr in indices:
+
+            involved = {}  # Sum node index -> actual dummy.
+            for i in expr.free_symbols:
+                if i in dumms:
+                    involved[dumms[i]] = i
+
+            # Dummies over the same range are put adjacent, since only they
+            # can be permuted with each other.
+            sum_nodes = sorted(involved.keys(), key=lambda x: (colours[x], x))
+            groups = tuple(len(list(g)) for _, g in itertools.groupby(
+                sum_nodes, lambda x: colours[x]
+            ))
+
+            if len(sum_nodes) > 2:
+                suspicious.append(expr)
+
+            curr_order, curr_slots, curr_symms = _canon_index(
+                expr, tuple(involved[i] for i in sum_nodes), groups
+            )
+
+            # Now the order of the edges are determined.
+            index_nodes.append(eldag.add_node(
+                [sum_nodes[i] for i in curr_slots], curr_symms,
+                (term_idx, _EXPR, curr_order)
+            ))
 
-        index_nodes = _proc_indices(indices, dumms, eldag)
         idx = eldag.add_node(
-            index_nodes, factor_symms, (_FACTOR, colour)
+            index_nodes, factor_symms, (term_idx, _FACTOR, colour)
         )
 
         factor_idxes.append(idx)
-        continue
 
-    return eldag, factor_idxes
+    return factor_idxes
+
+
+def _warn_many_dumms(expr, stacklevel):
+    """Warn about an index expression with too many summed dummies.
+
+    The stack level is relative to the caller of this function.
+    """
+
+    warnings.warn(
+        'Index expression {} contains too many summed dummies, '
+        'something might be wrong'.format(expr), stacklevel=stacklevel + 1
+    )
+
+
+# Sentinel for absent entries in the symmetries.
+_NO_ENTRY = object()
+
+
+def _get_symms(base, n_indices, symms):
+    """Get the symmetry of a factor with the given base and valence."""
+
+    if n_indices < 2:
+        return None
+
+    # None can be set explicitly to remove the symmetry for a valence.
+    factor_symms = symms.get((base, n_indices), _NO_ENTRY)
+    if factor_symms is _NO_ENTRY:
+        factor_symms = symms.get(base)
+    return factor_symms
 
 
 class _Placeholders(dict):
@@ -216,76 +446,162 @@ class _Placeholders(dict):
 
     def __missing__(self, key):
         """Add the placeholder for the given dummy."""
-        return Symbol('internalDummyPlaceholder{}'.format(key))
+        placeholder = Symbol('internalDummyPlaceholder{}'.format(key))
+        self[key] = placeholder
+        return placeholder
 
 
 _placeholders = _Placeholders()
 
+# The maximum number of permutations of the dummies in an index expression to
+# be tried, as for six dummies over the same range.
+_MAX_SLOTS_PERMS = 720
 
-def _proc_indices(indices, dumms, eldag):
-    """Process the indices to a given factor.
-
-    The symmetry of the expressions at the indices with respect to the dummies
-    are fully treated.
-    """
-    nodes = []
+# Permutations of the slots of dummies, for the common cases of few dummies.
+_SLOTS_PERMS = {
+    2: ((0, 1), (1, 0)),
+    3: ((0, 1, 2), (0, 2, 1), (1, 0, 2), (1, 2, 0), (2, 0, 1), (2, 1, 0))
+}
 
-    for expr in indices:
 
-        involved = {}  # Sum node index -> actual dummy.
-        for i in expr.atoms(Symbol):
-            if i in dumms:
-                involved[dumms[i]] = i
-            continue
+@functools.lru_cache(maxsize=4096)
+def _canon_index(expr, dumms, groups):
+    """Canonicalize an index expression with respect to the given dummies.
 
-        sum_nodes = list(involved.keys())
+    The canonical order of the dummies is returned as slots into the given
+    sequence of dummies, along with the sort key of the canonical form and the
+    symmetry of the expression.  Since the result is independent of the actual
+    nodes of the dummies, it is cached for the same index expressions occurring
+    again and again in the factors.
 
-        curr_form = None
-        curr_order = None
-        curr_edges = None
-        curr_symms = []
+    The dummies over the same range should be adjacent in the given sequence,
+    with the number of dummies over each range given in the groups.  Only
+    dummies within the same group are permuted, since summations over
+    different ranges are never equivalent.
+    """
 
-        if len(sum_nodes) > 2:
-            warnings.warn(
-                "Index expression", expr,
-                "contains too many summed dummies, something might be wrong"
+    n_dumms = len(dumms)
+
+    # Fast paths, where no search is needed.
+    if n_dumms == 0:
+        return sympy_key(expr), (), None
+    elif n_dumms == 1:
+        form = expr.xreplace({dumms[0]: _placeholders[0]})
+        return sympy_key(form), (0,), None
+
+    curr_form = None
+    curr_order = None
+    curr_slots = None
+    curr_symms = []
+
+    # Symmetric expressions give the same form for different permutations.
+    keys = {}
+
+    n_slots_perms = 1
+    for i in groups:
+        n_slots_perms *= math.factorial(i)
+
+    if n_slots_perms > _MAX_SLOTS_PERMS:
+        # Trying all the permutations is infeasible, the dummies are ordered
+        # heuristically by the forms with only themselves distinguished, where
+        # all the other dummies are replaced by a placeholder shared within
+        # their group.  Dummies with the same key are ordered by their nodes,
+        # with the swapping of adjacent ones recorded as symmetry when it
+        # leaves the form invariant.  The result is still not guaranteed to
+        # be canonical.
+        group_idxes = [i for i, v in enumerate(groups) for _ in range(v)]
+        shared = {
+            v: _placeholders[n_dumms + group_idxes[i]]
+            for i, v in enumerate(dumms)
+        }
+        distinguished = _placeholders[n_dumms + len(groups)]
+
+        dumm_keys = []
+        for i, v in enumerate(dumms):
+            substs = dict(shared)
+            substs[v] = distinguished
+            dumm_keys.append(
+                (group_idxes[i], sympy_key(expr.xreplace(substs)))
             )
 
-        for edges in itertools.permutations(sum_nodes):
-            substs = {
-                involved[v]: _placeholders[i]
-                for i, v in enumerate(edges)
-                }
-            form = expr.xreplace(substs)
-
-            order = sympy_key(form)
-            if curr_form is None or order < curr_order:
-                curr_form = form
-                curr_order = order
-                curr_edges = edges
-                curr_symms = []
-            elif form == curr_form:
-                curr_symms.append(_find_perm(curr_edges, edges))
-            continue
+        curr_slots = tuple(sorted(range(n_dumms), key=lambda x: dumm_keys[x]))
+        form = expr.xreplace({
+            dumms[v]: _placeholders[i] for i, v in enumerate(curr_slots)
+        })
 
-        # Now the order of the edges are determined.
-
-        idx = eldag.add_node(
-            curr_edges, Group(curr_symms) if len(curr_symms) > 0 else None,
-            (_EXPR, curr_order)
+        for i in range(n_dumms - 1):
+            if dumm_keys[curr_slots[i]] != dumm_keys[curr_slots[i + 1]]:
+                continue
+            swapped = form.xreplace({
+                _placeholders[i]: _placeholders[i + 1],
+                _placeholders[i + 1]: _placeholders[i]
+            })
+            if swapped == form:
+                slots = list(curr_slots)
+                slots[i], slots[i + 1] = slots[i + 1], slots[i]
+                curr_symms.append(_find_perm(curr_slots, slots))
+
+        return (
+            sympy_key(form), curr_slots,
+            Group(curr_symms) if len(curr_symms) > 0 else None
         )
 
-        nodes.append(idx)
-        continue
+    for slots in _get_slots_perms(groups):
+        substs = {
+            dumms[v]: _placeholders[i]
+            for i, v in enumerate(slots)
+            }
+        form = expr.xreplace(substs)
 
-    return nodes
+        if form in keys:
+            order = keys[form]
+        else:
+            order = sympy_key(form)
+            keys[form] = order
+
+        if curr_form is None or order < curr_order:
+            curr_form = form
+            curr_order = order
+            curr_slots = slots
+            curr_symms = []
+        elif form is curr_form or form == curr_form:
+            curr_symms.append(_find_perm(curr_slots, slots))
+
+    return (
+        curr_order, curr_slots,
+        Group(curr_symms) if len(curr_symms) > 0 else None
+    )
+
+
+def _get_slots_perms(groups):
+    """Get the permutations of the slots of dummies within the groups."""
+
+    group_perms = []
+    start = 0
+    for size in groups:
+        if start == 0 and size in _SLOTS_PERMS:
+            group_perms.append(_SLOTS_PERMS[size])
+        else:
+            group_perms.append(
+                itertools.permutations(range(start, start + size))
+            )
+        start += size
+
+    if len(group_perms) == 1:
+        return group_perms[0]
+    else:
+        return (sum(i, ()) for i in itertools.product(*group_perms))
 
 
 def _find_perm(orig, dest):
     """Find the permutation bringing the original sequence to the target.
 
-    Internal function, no checking.
+    Both sequences should be permutations of the points from zero, as the
+    slots of dummies in index expressions.  Internal function, no checking.
     """
 
-    idxes = {v: i for i, v in enumerate(orig)}
-    return Perm(idxes[i] for i in dest)
+    idxes = [0] * len(orig)
+    for i, v in enumerate(orig):
+        idxes[v] = i
+
+    return Perm.from_buffer(array.array('i', [idxes[i] for i in dest]))
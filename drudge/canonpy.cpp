@@ -6,6 +6,7 @@
 #include <Python.h>
 
 #include <algorithm>
+#include <cstring>
 #include <memory>
 #include <string>
 #include <vector>
@@ -51,6 +52,54 @@ using I_err = int;
 
 static constexpr I_err err = 1;
 
+/** Reads unsigned integral points from a contiguous buffer of C int.
+ *
+ * The boolean flag will be set when the given object is such a buffer and the
+ * points are successfully read.  Other objects are left untouched with the
+ * flag unset, so that they can be read in other ways.
+ */
+
+static Point_vec read_points_buffer(PyObject* obj, bool& read)
+{
+    Point_vec res{};
+    read = false;
+
+    if (!PyObject_CheckBuffer(obj)) {
+        return res;
+    }
+
+    Py_buffer view;
+    if (PyObject_GetBuffer(obj, &view, PyBUF_FORMAT | PyBUF_C_CONTIGUOUS)
+        != 0) {
+        PyErr_Clear();
+        return res;
+    }
+
+    bool if_int = view.itemsize == sizeof(int) && view.format != NULL
+        && std::strcmp(view.format, "i") == 0;
+    if (!if_int) {
+        PyBuffer_Release(&view);
+        return res;
+    }
+
+    const int* data = static_cast<const int*>(view.buf);
+    Py_ssize_t n_points = view.len / view.itemsize;
+    res.reserve(n_points);
+
+    for (Py_ssize_t i = 0; i < n_points; ++i) {
+        if (data[i] < 0) {
+            PyBuffer_Release(&view);
+            PyErr_SetString(PyExc_ValueError, "Negative point given");
+            throw err;
+        }
+        res.push_back(data[i]);
+    }
+
+    PyBuffer_Release(&view);
+    read = true;
+    return res;
+}
+
 //
 // Perm class
 // ==========
@@ -214,6 +263,51 @@ static Simple_perm make_perm_from_args(PyObject* args, PyObject* kwargs)
     }
 }
 
+/** Makes a permutation from a contiguous buffer of its pre-images.
+ *
+ * The arguments are the same as for `make_perm_from_args`, except that the
+ * pre-images need to be given as a contiguous buffer of C int, which is copied
+ * directly.
+ */
+
+static Simple_perm make_perm_from_buffer(PyObject* args, PyObject* kwargs)
+{
+    PyObject* pre_images;
+    char acc = 0;
+
+    static char* kwlist[] = { "pre_images", "acc", NULL };
+
+    auto args_stat = PyArg_ParseTupleAndKeywords(
+        args, kwargs, "O|b", kwlist, &pre_images, &acc);
+
+    if (!args_stat)
+        throw err;
+
+    bool read;
+    Point_vec pre_images_vec = read_points_buffer(pre_images, read);
+    if (!read) {
+        PyErr_SetString(
+            PyExc_TypeError, "Contiguous buffer of C int expected");
+        throw err;
+    }
+
+    size_t size = pre_images_vec.size();
+    std::vector<bool> image_set(size, false);
+    for (auto pre_image : pre_images_vec) {
+        if (pre_image >= size || image_set[pre_image]) {
+            std::string err_msg("Invalid image ");
+            err_msg += std::to_string(pre_image);
+            err_msg += " for permutation of size ";
+            err_msg += std::to_string(size);
+            PyErr_SetString(PyExc_ValueError, err_msg.c_str());
+            throw err;
+        }
+        image_set[pre_image] = true;
+    }
+
+    return Simple_perm(std::move(pre_images_vec), acc);
+}
+
 //
 // Interface functions
 // -------------------
@@ -344,6 +438,34 @@ static PyObject* perm_new(PyTypeObject* type, PyObject* args, PyObject* kwargs)
     return (PyObject*)self;
 }
 
+const static char* perm_from_buffer_doc
+    = "Create a Perm from a contiguous buffer of C int for the pre-images.";
+
+/** Creates a new Perm object from a buffer.
+ */
+
+static PyObject* perm_from_buffer(
+    PyTypeObject* type, PyObject* args, PyObject* kwargs)
+{
+    Perm_object* self;
+
+    self = (Perm_object*)type->tp_alloc(type, 0);
+
+    if (!self)
+        return NULL;
+
+    Simple_perm perm{};
+    try {
+        perm = make_perm_from_buffer(args, kwargs);
+    } catch (I_err) {
+        Py_DECREF(self);
+        return NULL;
+    }
+
+    new (&self->perm) Simple_perm(std::move(perm));
+    return (PyObject*)self;
+}
+
 //
 // Class definition
 // ----------------
@@ -355,6 +477,8 @@ static PyObject* perm_new(PyTypeObject* type, PyObject* args, PyObject* kwargs)
 static PyMethodDef perm_methods[] = {
     { "__getnewargs__", (PyCFunction)perm_getnewargs, METH_NOARGS,
         perm_getnewargs_doc },
+    { "from_buffer", (PyCFunction)perm_from_buffer,
+        METH_VARARGS | METH_KEYWORDS | METH_CLASS, perm_from_buffer_doc },
     { NULL, NULL } /* sentinel */
 };
 
@@ -397,7 +521,9 @@ static const char* perm_doc =
 Permutations can be constructed from an iterable giving the pre-image of the
 points and an optional integral value for the accompanied action.  The
 accompanied action can be given positionally or by the keyword ``acc``, and it
-will be manipulated according to the convention in libcanon.
+will be manipulated according to the convention in libcanon.  The pre-images
+can also be given as a contiguous buffer of C int, like ``array.array('i')``,
+to the class method ``from_buffer``, which directly copies the buffer.
 
 Querying the length of a Perm object gives the size of the permutation domain,
 while indexing it gives the pre-image of the given integral point.  The
@@ -1010,10 +1136,19 @@ static std::vector<T> read_py_iter(PyObject* iterable, F get_value)
 }
 
 /** Reads unsigned integral points from a Python iterable.
+ *
+ * Contiguous buffers of C int, like ``array.array('i')``, are directly copied
+ * without going through the Python iteration protocol.
  */
 
 static Point_vec read_points(PyObject* iterable)
 {
+    bool read;
+    auto res = read_points_buffer(iterable, read);
+    if (read) {
+        return res;
+    }
+
     return read_py_iter<size_t>(iterable, [](PyObject* item) {
         if (!PyLong_Check(item)) {
             throw err;
@@ -1144,7 +1279,8 @@ Parameters
 edges
 
     An iterable of integers giving the edges in the Eldag.  It will be cast
-    into a sequence internally.
+    into a sequence internally.  Contiguous buffers of C int, like
+    ``array.array('i')``, are directly copied.
 
 ia
 
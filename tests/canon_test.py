@@ -0,0 +1,196 @@
+"""Tests for the canonicalization of tensorial factors."""
+
+import pytest
+from sympy import IndexedBase, symbols
+
+from drudge import Perm, Group, NEG, Range
+from drudge.canon import canon_factors, canon_factors_batch, _canon_index
+
+
+def test_factors_can_be_canonicalized_in_batch():
+    """Tests the canonicalization of the factors of multiple terms together.
+
+    Here an antisymmetric tensor is given with its free indices in different
+    orders, along with a tensor without any symmetry.  The results should be
+    the same as the canonicalization of the terms one by one.
+    """
+
+    a, b = symbols('a b')
+    x = IndexedBase('x')
+    y = IndexedBase('y')
+    symms = {x: Group([Perm([1, 0], NEG)])}
+
+    terms = [
+        ([], [(x[b, a], 0)], symms),
+        ([], [(y[b, a], 0)], symms),
+        ([], [(x[a, b], 0)], symms)
+    ]
+    res = canon_factors_batch(terms)
+
+    assert len(res) == len(terms)
+    assert res[0] == ([], [x[a, b]], -1)
+    assert res[1] == ([], [y[b, a]], 1)
+    assert res[2] == ([], [x[a, b]], 1)
+
+    for i, v in zip(terms, res):
+        assert canon_factors(*i) == v
+        continue
+
+    return
+
+
+def test_terms_with_dummies_can_be_canonicalized_in_batch():
+    """Tests the batch canonicalization of terms with summations.
+
+    Terms with dummies over a shared range, and with the dummies permuted, are
+    canonicalized in different orders in the batch.  The results for each term
+    should be the same as the canonicalization of the term alone.
+    """
+
+    a, b, c, p = symbols('a b c p')
+    x = IndexedBase('x')
+    r = Range('R')
+    symms = {x: Group([Perm([1, 0], NEG)])}
+
+    terms = [
+        ([(a, r), (b, r)], [(x[a, b], 0), (x[b, a], 1)], symms),
+        ([(b, r), (a, r)], [(x[b, a], 0), (x[a, b], 1)], symms),
+        ([(c, r)], [(x[p, c], 0)], symms),
+        ([(b, r), (c, r)], [(x[c, b], 0), (x[p, c], 1)], symms)
+    ]
+    expected = [canon_factors(*i) for i in terms]
+
+    for order in [[0, 1, 2, 3], [3, 2, 1, 0], [2, 0, 3, 1]]:
+        res = canon_factors_batch([terms[i] for i in order])
+        assert len(res) == len(order)
+        for i, v in zip(order, res):
+            assert v == expected[i]
+            continue
+        continue
+
+    return
+
+
+def test_index_with_many_dummies_is_independent_of_dummy_names():
+    """Tests the heuristic ordering of many dummies in an index expression.
+
+    The same index expression with two of its dummies swapped should give the
+    same canonical form, even though not all the permutations are tried.
+    """
+
+    dumms = symbols('a b c d e f g')
+    a, g = dumms[0], dumms[-1]
+    expr = sum((i + 1) * v for i, v in enumerate(dumms))
+    swapped = expr.xreplace({a: g, g: a})
+    assert swapped != expr
+
+    groups = (len(dumms),)
+    order, slots, symms = _canon_index(expr, dumms, groups)
+    swapped_order, swapped_slots, _ = _canon_index(swapped, dumms, groups)
+
+    assert order == swapped_order
+    assert slots != swapped_slots
+    assert symms is None
+
+    return
+
+
+def test_index_with_many_symmetric_dummies_has_symmetry():
+    """Tests the symmetry of index expressions with many tied dummies.
+
+    When the heuristic ordering cannot distinguish the dummies, the
+    interchange of them should be given as symmetry, so that the result does
+    not depend on the order of the dummies.
+    """
+
+    dumms = symbols('a b c d e f g')
+    expr = sum(dumms)
+    groups = (len(dumms),)
+
+    order, slots, symms = _canon_index(expr, dumms, groups)
+    reversed_order, _, reversed_symms = _canon_index(
+        expr, tuple(reversed(dumms)), groups
+    )
+
+    assert order == reversed_order
+    assert symms is not None
+    assert reversed_symms is not None
+
+    return
+
+
+def test_index_with_three_dummies_warns_and_canonicalizes():
+    """Tests index expressions with three dummies.
+
+    A warning should be given for the suspicious index expression, while the
+    canonicalization is still carried out.
+    """
+
+    a, b, c = symbols('a b c')
+    x = IndexedBase('x')
+    r = Range('R')
+    sums = [(c, r), (b, r), (a, r)]
+    factors = [(x[a + b + c], 0)]
+
+    with pytest.warns(UserWarning):
+        sums_res, factors_res, coeff = canon_factors(sums, factors, {})
+
+    assert sorted(sums_res, key=str) == sorted(sums, key=str)
+    assert factors_res == [x[a + b + c]]
+    assert coeff == 1
+
+    return
+
+
+def test_cached_terms_with_many_dummies_still_warn():
+    """Tests the warnings for repeated terms with too many dummies.
+
+    The warning should be given for each canonicalization of the term, even
+    when the result comes from the cache.
+    """
+
+    a, b, c = symbols('a b c')
+    x = IndexedBase('x')
+    r = Range('R')
+    sums = [(a, r), (b, r), (c, r)]
+    factors = [(x[a + b + c, a], 0)]
+
+    with pytest.warns(UserWarning):
+        res = canon_factors(sums, factors, {})
+    with pytest.warns(UserWarning):
+        assert canon_factors(sums, factors, {}) == res
+
+    return
+
+
+def test_canonicalization_results_are_cached_safely():
+    """Tests the caching of the canonicalization results of terms.
+
+    Repeated canonicalizations should give equal but fresh results, changes in
+    the symmetries should be respected, and terms with unhashable colours
+    should still be canonicalized.
+    """
+
+    a, b = symbols('a b')
+    x = IndexedBase('x')
+    symms = {x: Group([Perm([1, 0], NEG)])}
+    factors = [(x[b, a], 0)]
+
+    res = canon_factors([], factors, symms)
+    assert res == ([], [x[a, b]], -1)
+
+    # The results should not be aliases of the cached ones.
+    res[1].append(x[b, a])
+    new_res = canon_factors([], factors, symms)
+    assert new_res == ([], [x[a, b]], -1)
+    assert new_res[0] is not res[0]
+    assert new_res[1] is not res[1]
+
+    # Mutating the symmetries in place should change the result.
+    symms[x] = Group([Perm([1, 0])])
+    assert canon_factors([], factors, symms) == ([], [x[a, b]], 1)
+
+    # Unhashable colours.
+    assert canon_factors([], [(x[b, a], [0])], symms) == ([], [x[a, b]], 1)
+
+    return
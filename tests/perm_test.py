@@ -1,6 +1,7 @@
 """Tests for the basic permutation facility.
 """
 
+import array
 import pickle
 
 import pytest
@@ -52,6 +53,26 @@ def test_perm_pickles():
     return
 
 
+def test_perm_can_be_created_from_buffer():
+    """Test the creation of Perms from buffers of pre-images."""
+
+    pre_images = [1, 2, 0]
+    perm = Perm.from_buffer(array.array('i', pre_images), 1)
+
+    assert len(perm) == len(pre_images)
+    for i, v in enumerate(pre_images):
+        assert perm[i] == v
+    assert perm.acc == 1
+
+    with pytest.raises(ValueError):
+        Perm.from_buffer(array.array('i', [1, 1, 1]))
+
+    with pytest.raises(TypeError):
+        Perm.from_buffer(pre_images)
+
+    return
+
+
 def test_perm_reports_error():
     """Tests perm class reports error for invalid inputs."""
 